@@ -3,14 +3,22 @@ import json
 import logging
 import telebot
 import requests
-from telebot import types
+from telebot import types, apihelper
 from datetime import datetime, timedelta
 import time
 import random
-import wikipedia
+import sys
+import atexit
+import signal
+import tempfile
+import sqlite3
+import threading
+import itertools
+from collections import deque
 import firebase_admin
 from firebase_admin import credentials, firestore
 from flask import Flask, request
+from wiki_index import search_wikipedia_index
 
 # Flask serverini sozlash (webhook uchun)
 server = Flask(__name__)
@@ -23,9 +31,23 @@ logger = logging.getLogger(__name__)
 TELEGRAM_BOT_TOKEN = os.environ.get('TELEGRAM_BOT_TOKEN')
 WEATHER_API_KEY = os.environ.get('WEATHER_API_KEY')
 FIREBASE_CRED = os.environ.get('FIREBASE_CRED')
+UPDATE_DEADLINE = float(os.environ.get('UPDATE_DEADLINE', 8))
+CACHE_SNAPSHOT_PATH = os.environ.get('CACHE_SNAPSHOT_PATH', 'cache_snapshot.json')
+CACHE_SNAPSHOT_INTERVAL = int(os.environ.get('CACHE_SNAPSHOT_INTERVAL', 300))
+UPDATE_DEDUP_WINDOW = int(os.environ.get('UPDATE_DEDUP_WINDOW', 10000))
+UPDATE_DEDUP_DB = os.environ.get('UPDATE_DEDUP_DB')
+USAGE_FLUSH_INTERVAL = int(os.environ.get('USAGE_FLUSH_INTERVAL', 60))
+USAGE_COUNTER_SHARDS = int(os.environ.get('USAGE_COUNTER_SHARDS', 10))
+FEEDBACK_FLUSH_INTERVAL = int(os.environ.get('FEEDBACK_FLUSH_INTERVAL', 30))
+FEEDBACK_DIGEST_INTERVAL = int(os.environ.get('FEEDBACK_DIGEST_INTERVAL', 600))
+FEEDBACK_DUPLICATE_WINDOW = int(os.environ.get('FEEDBACK_DUPLICATE_WINDOW', 3600))
+FEEDBACK_USER_LIMIT = int(os.environ.get('FEEDBACK_USER_LIMIT', 5))
+FEEDBACK_QUEUE_LIMIT = int(os.environ.get('FEEDBACK_QUEUE_LIMIT', 5000))
 
 # Botni sozlash
-bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN)
+# threaded=False: handlerlar webhook so‘rovining o‘z oqimida ishlaydi, shunda
+# webhook kirishida belgilangan deadline barcha tashqi chaqiruvlarga yetib boradi
+bot = telebot.TeleBot(TELEGRAM_BOT_TOKEN, threaded=False)
 ADMINS = [1058402071]
 
 # Firebase sozlamalari
@@ -33,6 +55,226 @@ cred = credentials.Certificate(json.loads(FIREBASE_CRED))
 firebase_admin.initialize_app(cred)
 db = firestore.client()
 
+# Har bir yangilanish uchun vaqt byudjeti (deadline) va hisoblagichlar
+DEFAULT_CALL_TIMEOUT = 10
+MIN_CALL_TIMEOUT = 0.5
+TELEGRAM_GRACE_TIMEOUT = 3
+DEADLINE_MESSAGE = "⏳ Xizmat hozir sekin javob bermoqda. Iltimos, birozdan so‘ng qayta urinib ko‘ring."
+
+_deadline_local = threading.local()
+metrics = {"updates": 0, "update_redeliveries": 0, "update_dedup_errors": 0, "deadline_overruns": 0, "feedback_rejected": 0}
+metrics_lock = threading.Lock()
+
+class DeadlineExceeded(Exception):
+    pass
+
+def increment_metric(name, amount=1):
+    with metrics_lock:
+        metrics[name] = metrics.get(name, 0) + amount
+
+def start_deadline(seconds=UPDATE_DEADLINE):
+    _deadline_local.deadline = time.monotonic() + seconds
+    _deadline_local.exceeded = False
+
+def finish_deadline():
+    deadline = getattr(_deadline_local, "deadline", None)
+    if deadline is not None and (_deadline_local.exceeded or time.monotonic() > deadline):
+        increment_metric("deadline_overruns")
+        logger.warning(f"Yangilanish {UPDATE_DEADLINE} soniyalik vaqt byudjetidan oshib ketdi")
+    _deadline_local.deadline = None
+
+def remaining_time():
+    deadline = getattr(_deadline_local, "deadline", None)
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+def call_timeout(default=DEFAULT_CALL_TIMEOUT):
+    # Tashqi chaqiruv uchun qolgan vaqtni qaytaradi, byudjet tugagan bo‘lsa DeadlineExceeded
+    remaining = remaining_time()
+    if remaining is None:
+        return default
+    if remaining < MIN_CALL_TIMEOUT:
+        _deadline_local.exceeded = True
+        raise DeadlineExceeded(DEADLINE_MESSAGE)
+    return min(default, remaining)
+
+# Telegram API ulanishlari barcha oqimlar uchun umumiy sessiyada qayta ishlatiladi
+telegram_session = requests.Session()
+
+def firestore_call_options():
+    # Firestore mijozining o‘z qayta urinishlari (~60 s) byudjetdan oshib ketmasligi uchun
+    # deadline bor yangilanishlarda retry o‘chiriladi; fon vazifalarida standart retry qoladi
+    timeout = call_timeout()
+    if remaining_time() is None:
+        return {"timeout": timeout}
+    return {"timeout": timeout, "retry": None}
+
+def telegram_request_sender(method, url, **kwargs):
+    # Telegram javobi byudjet tugagan bo‘lsa ham qisqa muhlat bilan yuboriladi (degradatsiyalangan javob uchun)
+    remaining = remaining_time()
+    if remaining is not None:
+        kwargs["timeout"] = max(TELEGRAM_GRACE_TIMEOUT, min(DEFAULT_CALL_TIMEOUT, remaining))
+    return telegram_session.request(method, url, **kwargs)
+
+apihelper.CUSTOM_REQUEST_SENDER = telegram_request_sender
+
+# Jarayon ichidagi keshlar: har bir yozuv (tugash_vaqti, qiymat) ko‘rinishida saqlanadi.
+# Diskka JSON ko‘rinishida yoziladi (pickle’dan farqli o‘laroq o‘qishda kod bajarilmaydi);
+# tuple kalit va qiymatlar JSON’da ro‘yxatga aylanadi va yuklashda qayta tuple qilinadi
+CACHE_TTLS = {
+    "currency": 3600,
+    "weather": 600,
+    "forecast": 1800,
+    "wikipedia": 86400,
+}
+caches = {name: {} for name in CACHE_TTLS}
+cache_lock = threading.Lock()
+_snapshot_loaded = False
+
+def load_cache_snapshot():
+    # Diskdagi nusxa birinchi murojaatda yuklanadi, muddati o‘tgan yozuvlar tashlab yuboriladi
+    global _snapshot_loaded
+    with cache_lock:
+        if _snapshot_loaded:
+            return
+        _snapshot_loaded = True
+        try:
+            with open(CACHE_SNAPSHOT_PATH, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.error(f"Kesh nusxasini yuklashda xatolik: {e}")
+            return
+        now = time.time()
+        loaded = 0
+        for name, entries in snapshot.get("caches", {}).items():
+            if name not in caches:
+                continue
+            for key, expires_at, value in entries:
+                key = tuple(key) if isinstance(key, list) else key
+                value = tuple(value) if isinstance(value, list) else value
+                current = caches[name].get(key)
+                if expires_at > now and (current is None or current[0] < expires_at):
+                    caches[name][key] = (expires_at, value)
+                    loaded += 1
+        logger.info(f"Kesh nusxasidan {loaded} ta yozuv yuklandi")
+
+def save_cache_snapshot():
+    # Avvalgi nusxa hali yuklanmagan bo‘lsa (masalan, ishga tushishda xatolik), uni bo‘sh kesh
+    # bilan ustidan yozib yubormaslik uchun avval yuklab olinadi
+    if not _snapshot_loaded:
+        load_cache_snapshot()
+    now = time.time()
+    with cache_lock:
+        for entries in caches.values():
+            for key in [key for key, (expires_at, _) in entries.items() if expires_at <= now]:
+                del entries[key]
+        snapshot = {
+            "saved_at": now,
+            "caches": {
+                name: [[key, expires_at, value] for key, (expires_at, value) in entries.items()]
+                for name, entries in caches.items()
+            },
+        }
+    # Har bir jarayon o‘z vaqtinchalik faylini yozadi, shunda umumiy katalogda nusxalar aralashib ketmaydi
+    snapshot_dir = os.path.dirname(os.path.abspath(CACHE_SNAPSHOT_PATH))
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=snapshot_dir, prefix=os.path.basename(CACHE_SNAPSHOT_PATH) + ".", suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, CACHE_SNAPSHOT_PATH)
+    except (OSError, TypeError, ValueError) as e:
+        logger.error(f"Kesh nusxasini saqlashda xatolik: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def cache_get(name, key):
+    if not _snapshot_loaded:
+        load_cache_snapshot()
+    with cache_lock:
+        entry = caches[name].get(key)
+    if entry and entry[0] > time.time():
+        return entry[1]
+    return None
+
+def cache_set(name, key, value, ttl=None):
+    expires_at = time.time() + (CACHE_TTLS[name] if ttl is None else ttl)
+    with cache_lock:
+        caches[name][key] = (expires_at, value)
+
+def start_periodic(interval, func):
+    # Fon oqimida funksiyani muntazam ishga tushirish
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                func()
+            except Exception as e:
+                logger.error(f"{func.__name__} fon vazifasida xatolik: {e}")
+    threading.Thread(target=loop, name=func.__name__, daemon=True).start()
+
+threading.Thread(target=load_cache_snapshot, name="load_cache_snapshot", daemon=True).start()
+start_periodic(CACHE_SNAPSHOT_INTERVAL, save_cache_snapshot)
+atexit.register(save_cache_snapshot)
+
+def handle_sigterm(signum, frame):
+    # Render/dyno qayta ishga tushirishda SIGTERM yuboriladi; oddiy chiqish atexit hooklarini
+    # (kesh nusxasi, statistika va shikoyatlarni saqlash) ishga tushiradi
+    logger.info("SIGTERM qabul qilindi, ma’lumotlar saqlanib jarayon yakunlanmoqda")
+    sys.exit(0)
+
+signal.signal(signal.SIGTERM, handle_sigterm)
+
+# Telegram qayta yuborgan yangilanishlarni update_id bo‘yicha aniqlash:
+# oxirgi UPDATE_DEDUP_WINDOW ta ID halqa bufer (deque) va to‘plamda saqlanadi
+_seen_update_ids = set()
+_seen_update_order = deque()
+_dedup_lock = threading.Lock()
+
+_dedup_conn = None
+
+def init_shared_dedup():
+    # Jarayon UPDATE_DEDUP_DB ga bitta doimiy ulanish ochadi (Werkzeug har so‘rovga yangi oqim
+    # ochgani uchun oqim bo‘yicha ulanish foyda bermaydi); ulanish _dedup_lock bilan himoyalanadi.
+    # WAL rejimida bir nechta jarayonning yozuvlari bir-birini kamroq bloklaydi
+    global _dedup_conn
+    _dedup_conn = sqlite3.connect(UPDATE_DEDUP_DB, timeout=2, check_same_thread=False)
+    _dedup_conn.execute("PRAGMA journal_mode=WAL")
+    with _dedup_conn:
+        _dedup_conn.execute("CREATE TABLE IF NOT EXISTS seen_updates (update_id INTEGER PRIMARY KEY)")
+
+def _mark_update_seen_shared(update_id):
+    # UPDATE_DEDUP_DB berilgan bo‘lsa, bir nechta jarayon umumiy SQLite fayldan foydalanadi
+    try:
+        with _dedup_lock, _dedup_conn:
+            inserted = _dedup_conn.execute("INSERT OR IGNORE INTO seen_updates (update_id) VALUES (?)", (update_id,)).rowcount
+            _dedup_conn.execute("DELETE FROM seen_updates WHERE update_id <= ?", (update_id - UPDATE_DEDUP_WINDOW,))
+        return inserted == 1
+    except sqlite3.Error as e:
+        # Baza ishlamasa yangilanish qayta ishlanadi (fail-open); bunday holatlar alohida hisoblanadi
+        increment_metric("update_dedup_errors")
+        logger.error(f"Umumiy dedup bazasida xatolik, yangilanish {update_id} tekshiruvsiz qayta ishlanadi: {e}")
+        return True
+
+def mark_update_seen(update_id):
+    # Yangilanish avval ko‘rilmagan bo‘lsa True, qayta yuborilgan bo‘lsa False qaytaradi
+    with _dedup_lock:
+        if update_id in _seen_update_ids:
+            return False
+        if len(_seen_update_order) >= UPDATE_DEDUP_WINDOW:
+            _seen_update_ids.discard(_seen_update_order.popleft())
+        _seen_update_order.append(update_id)
+        _seen_update_ids.add(update_id)
+    if UPDATE_DEDUP_DB:
+        return _mark_update_seen_shared(update_id)
+    return True
+
+if UPDATE_DEDUP_DB:
+    init_shared_dedup()
+
 # Emoji sozlamalari
 weather_emojis = {
     "clear sky": "☀️ Quyoshli",
@@ -94,7 +336,7 @@ city_translations = {
 # Firebase’dan foydalanuvchilarni olish va saqlash
 def get_users():
     users_ref = db.collection("users")
-    users = users_ref.get()
+    users = users_ref.get(**firestore_call_options())
     return [user.to_dict() for user in users]
 
 def save_user(user_id, username):
@@ -104,17 +346,17 @@ def save_user(user_id, username):
         "user_id": user_id,
         "username": username,
         "banned": False
-    })
+    }, **firestore_call_options())
 
 def ban_user(user_id):
     users_ref = db.collection("users")
     user_ref = users_ref.document(str(user_id))
-    user_ref.update({"banned": True})
+    user_ref.update({"banned": True}, **firestore_call_options())
 
 def unban_user(user_id):
     users_ref = db.collection("users")
     user_ref = users_ref.document(str(user_id))
-    user_ref.update({"banned": False})
+    user_ref.update({"banned": False}, **firestore_call_options())
 
 def get_banned_users():
     users = get_users()
@@ -123,7 +365,7 @@ def get_banned_users():
 # Firebase’dan valyuta keshini olish va saqlash
 def get_currency_cache():
     cache_ref = db.collection("currency_cache").document("rates")
-    cache = cache_ref.get()
+    cache = cache_ref.get(**firestore_call_options())
     if cache.exists:
         return cache.to_dict()
     return {"timestamp": 0, "rates": {}}
@@ -133,7 +375,243 @@ def save_currency_cache(rates):
     cache_ref.set({
         "timestamp": int(time.time()),
         "rates": rates
-    })
+    }, **firestore_call_options())
+
+# Funksiyalardan foydalanish hisoblagichlari: har bir oqim o‘z xotira bo‘lagiga yozadi,
+# to‘plangan qiymatlar vaqti-vaqti bilan Firestore’dagi bo‘laklangan hujjatlarga qo‘shiladi
+USAGE_MEMORY_SHARDS = 16
+FEATURE_LABELS = {
+    "weather": "⛅ Ob-havo",
+    "prayer": "🕌 Namoz vaqtlari",
+    "currency": "💱 Valyuta kursi",
+    "wikipedia": "📚 Vikipediya",
+    "random_number": "🎲 Tasodifiy son",
+}
+
+_usage_shards = [({}, threading.Lock()) for _ in range(USAGE_MEMORY_SHARDS)]
+_usage_shard_counter = itertools.count()
+_usage_local = threading.local()
+
+def _merge_usage_counts(target, counts):
+    for key, count in counts.items():
+        target[key] = target.get(key, 0) + count
+
+def record_usage(feature, city=None):
+    shard = getattr(_usage_local, "shard", None)
+    if shard is None:
+        shard = _usage_local.shard = next(_usage_shard_counter) % USAGE_MEMORY_SHARDS
+    counts, lock = _usage_shards[shard]
+    key = (datetime.now().strftime("%Y-%m-%d"), feature, city)
+    with lock:
+        counts[key] = counts.get(key, 0) + 1
+
+def flush_usage_counters():
+    totals = {}
+    for counts, lock in _usage_shards:
+        with lock:
+            pending = dict(counts)
+            counts.clear()
+        _merge_usage_counts(totals, pending)
+    if not totals:
+        return
+    by_day = {}
+    for (day, feature, city), count in totals.items():
+        fields = by_day.setdefault(day, {"features": {}, "cities": {}})
+        fields["features"][feature] = fields["features"].get(feature, 0) + count
+        if city:
+            feature_cities = fields["cities"].setdefault(feature, {})
+            feature_cities[city] = feature_cities.get(city, 0) + count
+    shard_id = str(random.randrange(USAGE_COUNTER_SHARDS))
+    try:
+        batch = db.batch()
+        for day, fields in by_day.items():
+            shard_ref = db.collection("usage_counters").document(day).collection("shards").document(shard_id)
+            batch.set(shard_ref, {
+                "features": {feature: firestore.Increment(count) for feature, count in fields["features"].items()},
+                "cities": {
+                    feature: {city: firestore.Increment(count) for city, count in cities.items()}
+                    for feature, cities in fields["cities"].items()
+                },
+            }, merge=True)
+        batch.commit(**firestore_call_options())
+    except Exception as e:
+        # Yozib bo‘lmagan qiymatlar keyingi urinishda qayta yuboriladi. Agar commit vaqt muhlati
+        # tugagan, lekin serverda bajarilgan bo‘lsa, bu qiymatlar ikki marta hisoblanadi:
+        # statistika uchun ortiqcha sanash yo‘qotishdan ko‘ra maqbul deb qabul qilingan
+        logger.warning(f"Foydalanish statistikasini saqlashda xatolik, {sum(totals.values())} ta hisob qayta yuboriladi "
+                       f"(commit serverda bajarilgan bo‘lsa ikki marta hisoblanishi mumkin): {e}")
+        counts, lock = _usage_shards[0]
+        with lock:
+            _merge_usage_counts(counts, totals)
+
+def get_usage_stats(days=7):
+    flush_usage_counters()
+    today = datetime.now()
+    stats = []
+    for i in range(days):
+        day = (today - timedelta(days=i)).strftime("%Y-%m-%d")
+        shards = db.collection("usage_counters").document(day).collection("shards").get(**firestore_call_options())
+        features = {}
+        cities = {}
+        for shard in shards:
+            data = shard.to_dict()
+            _merge_usage_counts(features, data.get("features", {}))
+            for feature_cities in data.get("cities", {}).values():
+                _merge_usage_counts(cities, feature_cities)
+        stats.append((day, features, cities))
+    return stats
+
+def format_usage_stats(stats):
+    lines = ["📊 **Foydalanish statistikasi:**"]
+    for day, features, cities in stats:
+        if not features:
+            continue
+        lines.append(f"\n📅 {day}:")
+        for feature, count in sorted(features.items(), key=lambda item: -item[1]):
+            lines.append(f"{FEATURE_LABELS.get(feature, feature)}: {count}")
+        top_cities = sorted(cities.items(), key=lambda item: -item[1])[:5]
+        if top_cities:
+            lines.append("🏙️ Shaharlar: " + ", ".join(f"{city} ({count})" for city, count in top_cities))
+    if len(lines) == 1:
+        lines.append("Hozircha ma’lumot yo‘q.")
+    return "\n".join(lines)
+
+start_periodic(USAGE_FLUSH_INTERVAL, flush_usage_counters)
+# SIGTERM’da ham ishlaydi: handle_sigterm oddiy chiqish orqali atexit hooklarini chaqiradi
+atexit.register(flush_usage_counters)
+
+# Shikoyat va takliflar navbati: yozuvlar to‘plam bo‘lib saqlanadi, adminlarga esa
+# FEEDBACK_DIGEST_INTERVAL da bir martadan ko‘p bo‘lmagan umumiy xabar yuboriladi
+FEEDBACK_DIGEST_LIMIT = 10
+FIRESTORE_BATCH_LIMIT = 500
+_pending_feedback = {}
+_feedback_digest = []
+_recent_feedback = {}
+_feedback_user_times = {}
+_feedback_lock = threading.Lock()
+_last_feedback_digest = 0
+
+def enqueue_feedback(user_id, username, text):
+    # Natija: "accepted", "duplicate", "rate_limited" yoki "queue_full".
+    # Bir foydalanuvchining takroriy xabarlari bitta yozuvga birlashtiriladi (count oshadi);
+    # yangi xabarlar foydalanuvchi bo‘yicha FEEDBACK_DUPLICATE_WINDOW ichida FEEDBACK_USER_LIMIT ta
+    # bilan, navbat esa FEEDBACK_QUEUE_LIMIT ta yozuv bilan cheklanadi
+    now = int(time.time())
+    key = (user_id, " ".join(text.lower().split()))
+    with _feedback_lock:
+        entry = _recent_feedback.get(key)
+        if entry and now - entry["created"] < FEEDBACK_DUPLICATE_WINDOW:
+            entry["count"] += 1
+            entry["updated"] = now
+            _pending_feedback[entry["id"]] = entry
+            return "duplicate"
+        user_times = _feedback_user_times.setdefault(user_id, deque())
+        while user_times and now - user_times[0] >= FEEDBACK_DUPLICATE_WINDOW:
+            user_times.popleft()
+        if len(user_times) >= FEEDBACK_USER_LIMIT:
+            increment_metric("feedback_rejected")
+            return "rate_limited"
+        if len(_pending_feedback) >= FEEDBACK_QUEUE_LIMIT:
+            increment_metric("feedback_rejected")
+            logger.warning(f"Shikoyatlar navbati to‘lgan ({FEEDBACK_QUEUE_LIMIT} ta), yangi xabar qabul qilinmadi")
+            return "queue_full"
+        user_times.append(now)
+        entry = {
+            "id": f"{user_id}_{now}_{len(_recent_feedback)}",
+            "user_id": user_id,
+            "username": username,
+            "text": text,
+            "count": 1,
+            "created": now,
+            "updated": now,
+        }
+        _recent_feedback[key] = entry
+        _pending_feedback[entry["id"]] = entry
+        _feedback_digest.append(entry)
+        return "accepted"
+
+def flush_feedback_queue():
+    now = int(time.time())
+    with _feedback_lock:
+        pending = dict(_pending_feedback)
+        records = {entry_id: dict(entry) for entry_id, entry in pending.items()}
+        _pending_feedback.clear()
+        for key in [key for key, entry in _recent_feedback.items() if now - entry["created"] >= FEEDBACK_DUPLICATE_WINDOW]:
+            del _recent_feedback[key]
+        for user_id in [user_id for user_id, times in _feedback_user_times.items() if not times or now - times[-1] >= FEEDBACK_DUPLICATE_WINDOW]:
+            del _feedback_user_times[user_id]
+    if not pending:
+        return
+    # Firestore bitta batch’da 500 tadan ortiq yozuvni qabul qilmaydi; muvaffaqiyatsiz
+    # bo‘laklargina navbatga qaytariladi
+    items = list(records.items())
+    failed = []
+    for start in range(0, len(items), FIRESTORE_BATCH_LIMIT):
+        chunk = items[start:start + FIRESTORE_BATCH_LIMIT]
+        try:
+            batch = db.batch()
+            for entry_id, record in chunk:
+                batch.set(db.collection("feedback").document(entry_id), record)
+            batch.commit(**firestore_call_options())
+        except Exception as e:
+            logger.error(f"Shikoyat va takliflarni saqlashda xatolik ({len(chunk)} ta yozuv qayta navbatga qo‘yildi): {e}")
+            failed.extend(entry_id for entry_id, _ in chunk)
+    if failed:
+        with _feedback_lock:
+            for entry_id in failed:
+                _pending_feedback.setdefault(entry_id, pending[entry_id])
+
+def send_feedback_digest(force=False):
+    global _last_feedback_digest
+    now = time.time()
+    with _feedback_lock:
+        if not _feedback_digest or (not force and now - _last_feedback_digest < FEEDBACK_DIGEST_INTERVAL):
+            return
+        entries = list(_feedback_digest)
+        _feedback_digest.clear()
+        _last_feedback_digest = now
+    lines = [f"📝 Yangi shikoyat/takliflar: {len(entries)} ta"]
+    for entry in entries[:FEEDBACK_DIGEST_LIMIT]:
+        repeated = f" (×{entry['count']})" if entry["count"] > 1 else ""
+        lines.append(f"• {entry['username']} (ID: {entry['user_id']}){repeated}: {entry['text'][:200]}")
+    if len(entries) > FEEDBACK_DIGEST_LIMIT:
+        lines.append(f"... va yana {len(entries) - FEEDBACK_DIGEST_LIMIT} ta")
+    lines.append("📥 To‘liq ro‘yxat admin panelidagi «Shikoyatlar» bo‘limida.")
+    digest = "\n".join(lines)
+    for admin_id in ADMINS:
+        try:
+            bot.send_message(admin_id, digest)
+        except Exception as e:
+            logger.error(f"Admin {admin_id} ga xabar yuborishda xato: {e}")
+
+def process_feedback_queue():
+    flush_feedback_queue()
+    send_feedback_digest()
+
+def shutdown_feedback_queue():
+    # Jarayon to‘xtashidan oldin navbat saqlanadi va yuborilmagan umumiy xabar adminlarga jo‘natiladi
+    flush_feedback_queue()
+    send_feedback_digest(force=True)
+
+def get_feedback_inbox(limit=10):
+    flush_feedback_queue()
+    query = db.collection("feedback").order_by("created", direction=firestore.Query.DESCENDING).limit(limit)
+    return [doc.to_dict() for doc in query.get(**firestore_call_options())]
+
+def format_feedback_inbox(entries):
+    if not entries:
+        return "📥 Shikoyat va takliflar yo‘q!"
+    lines = ["📥 **So‘nggi shikoyat va takliflar:**"]
+    for entry in entries:
+        created = datetime.fromtimestamp(entry["created"]).strftime("%Y-%m-%d %H:%M")
+        repeated = f" (×{entry['count']})" if entry.get("count", 1) > 1 else ""
+        # Telegram xabari 4096 belgidan oshmasligi uchun matn qisqartiriladi
+        lines.append(f"\n🕒 {created} — {entry['username']} (ID: {entry['user_id']}){repeated}\n{entry['text'][:200]}")
+    return "\n".join(lines)
+
+start_periodic(FEEDBACK_FLUSH_INTERVAL, process_feedback_queue)
+# SIGTERM’da ham ishlaydi: handle_sigterm oddiy chiqish orqali atexit hooklarini chaqiradi
+atexit.register(shutdown_feedback_queue)
 
 def is_admin(user_id):
     return user_id in ADMINS
@@ -149,15 +627,56 @@ def retry_on_failure(func, max_retries=3, delay=5):
             else:
                 raise e
 
+def format_wikipedia_matches(matches):
+    title, summary = matches[0]
+    info = f"📚 **{title}**\n{summary}"
+    related = [other_title for other_title, _ in matches[1:4]]
+    if related:
+        info += "\n\n🔎 O‘xshash maqolalar: " + ", ".join(related)
+    return info
+
+WIKIPEDIA_API_URL = "https://uz.wikipedia.org/w/api.php"
+
 def get_wikipedia_info(query):
+    # Avval mahalliy indeksdan qidiriladi, topilmasa uz.wikipedia.org ga murojaat qilinadi
+    matches = search_wikipedia_index(query)
+    if matches:
+        return format_wikipedia_matches(matches)
+    cache_key = query.strip().lower()
+    cached = cache_get("wikipedia", cache_key)
+    if cached:
+        return cached
     try:
-        wikipedia.set_lang("uz")
-        summary = wikipedia.summary(query, sentences=3)
+        # Qidiruv va qisqacha mazmun MediaWiki API’ga bitta so‘rov bilan, qolgan vaqt muhlatida olinadi
+        params = {
+            "action": "query",
+            "format": "json",
+            "formatversion": 2,
+            "generator": "search",
+            "gsrsearch": query,
+            "gsrlimit": 5,
+            "prop": "extracts|pageprops",
+            "ppprop": "disambiguation",
+            "exintro": 1,
+            "explaintext": 1,
+            "exsentences": 3,
+            "exlimit": 5,
+            "redirects": 1,
+        }
+        response = requests.get(WIKIPEDIA_API_URL, params=params, headers={"User-Agent": "infoyordamchibot"}, timeout=call_timeout())
+        response.raise_for_status()
+        pages = sorted(response.json().get("query", {}).get("pages", []), key=lambda page: page.get("index", 0))
+        if not pages:
+            return "Bu mavzu bo‘yicha ma’lumot topilmadi"
+        if "disambiguation" in pages[0].get("pageprops", {}):
+            return f"Bu so‘z bir nechta ma’noga ega bo‘lishi mumkin: {[page['title'] for page in pages[1:]]}"
+        summary = pages[0].get("extract")
+        if not summary:
+            return "Bu mavzu bo‘yicha ma’lumot topilmadi"
+        cache_set("wikipedia", cache_key, summary)
         return summary
-    except wikipedia.exceptions.DisambiguationError as e:
-        return f"Bu so‘z bir nechta ma’noga ega bo‘lishi mumkin: {e.options}"
-    except wikipedia.exceptions.PageError:
-        return "Bu mavzu bo‘yicha ma’lumot topilmadi"
+    except DeadlineExceeded:
+        return DEADLINE_MESSAGE
     except Exception as e:
         return f"Xatolik yuz berdi: {str(e)}"
 
@@ -188,23 +707,40 @@ def get_weather_advice(temp, desc, wind_speed, precipitation):
     return "\n".join(advice) if advice else "🌟 Maxsus maslahat yo‘q. Ob-havoga qarab ehtiyot bo‘ling!"
 
 def get_current_weather_by_city(city):
+    cache_key = city.strip().lower()
+    cached = cache_get("weather", cache_key)
+    if cached:
+        return cached
     try:
         url = f"http://api.openweathermap.org/data/2.5/weather?q={city}&appid={WEATHER_API_KEY}&units=metric&lang=uz"
-        response = requests.get(url, timeout=10).json()
+        response = requests.get(url, timeout=call_timeout()).json()
         if response.get("cod") != 200:
             return "❌ Shahar topilmadi! Iltimos, to‘g‘ri nom kiriting.", None, None, None
-        return process_weather_response(response)
+        result = process_weather_response(response)
+        cache_set("weather", cache_key, result)
+        return result
+    except DeadlineExceeded:
+        return DEADLINE_MESSAGE, None, None, None
     except requests.RequestException as e:
         logger.error(f"Ob-havo ma’lumotlarini olishda xatolik: {e}")
         return "⚠️ Ob-havo ma’lumotlarini olishda xatolik yuz berdi.", None, None, None
 
 def get_current_weather_by_coords(lat, lon):
+    # Taxminan 1 km aniqlikdagi koordinatalar bir xil kesh kalitiga tushadi
+    cache_key = (round(lat, 2), round(lon, 2))
+    cached = cache_get("weather", cache_key)
+    if cached:
+        return cached
     try:
         url = f"http://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric&lang=uz"
-        response = requests.get(url, timeout=10).json()
+        response = requests.get(url, timeout=call_timeout()).json()
         if response.get("cod") != 200:
             return "❌ Joylashuv bo‘yicha ma’lumot topilmadi.", None, None, None
-        return process_weather_response(response)
+        result = process_weather_response(response)
+        cache_set("weather", cache_key, result)
+        return result
+    except DeadlineExceeded:
+        return DEADLINE_MESSAGE, None, None, None
     except requests.RequestException as e:
         logger.error(f"Ob-havo ma’lumotlarini olishda xatolik: {e}")
         return "⚠️ Ob-havo ma’lumotlarini olishda xatolik yuz berdi.", None, None, None
@@ -234,9 +770,13 @@ def process_weather_response(response):
     return weather_info, response["coord"]["lat"], response["coord"]["lon"], city
 
 def get_forecast_weather(lat, lon):
+    cache_key = (round(lat, 2), round(lon, 2))
+    cached = cache_get("forecast", cache_key)
+    if cached:
+        return cached
     try:
         url = f"http://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={WEATHER_API_KEY}&units=metric&lang=uz"
-        response = requests.get(url, timeout=10).json()
+        response = requests.get(url, timeout=call_timeout()).json()
         if response.get("cod") != "200":
             return None
         forecast_data = {}
@@ -250,7 +790,11 @@ def get_forecast_weather(lat, lon):
                     "wind": entry["wind"]["speed"],
                     "precipitation": entry.get("rain", {}).get("3h", 0) or entry.get("snow", {}).get("3h", 0)
                 }
+        cache_set("forecast", cache_key, forecast_data)
         return forecast_data
+    except DeadlineExceeded:
+        # Prognozsiz joriy ob-havo bilan javob beriladi
+        return None
     except requests.RequestException as e:
         logger.error(f"Ob-havo prognozini olishda xatolik: {e}")
         return None
@@ -260,13 +804,14 @@ def translate_city_name(city):
     return city_translations.get(city, city.capitalize())
 
 def get_prayer_times_by_city(city):
+    # (javob matni, muvaffaqiyatli, statistika uchun shahar) qaytaradi
     try:
         city = translate_city_name(city)
         current_date = datetime.now().strftime("%d-%m-%Y")
         url = f"http://api.aladhan.com/v1/timingsByCity?city={city}&country=Uzbekistan&method=2"
-        response = requests.get(url, timeout=10).json()
+        response = requests.get(url, timeout=call_timeout()).json()
         if response["code"] != 200:
-            return "❌ Shahar topilmadi! Iltimos, to‘g‘ri nom kiriting yoki joylashuvingizni yuboring."
+            return "❌ Shahar topilmadi! Iltimos, to‘g‘ri nom kiriting yoki joylashuvingizni yuboring.", False, None
         timings = response["data"]["timings"]
         prayer_info = (
             f"🕌 **{city}dagi bugungi namoz vaqtlari ({current_date}):**\n"
@@ -277,21 +822,24 @@ def get_prayer_times_by_city(city):
             f"{prayer_emojis['Maghrib']}: {timings['Maghrib']}\n"
             f"{prayer_emojis['Isha']}: {timings['Isha']}"
         )
-        return prayer_info
+        # Aladhan shahar nomini tekshirmaydi, shuning uchun statistikaga faqat ma’lum shaharlar yoziladi
+        stats_city = city if city in city_translations.values() else None
+        return prayer_info, True, stats_city
+    except DeadlineExceeded:
+        return DEADLINE_MESSAGE, False, None
     except requests.RequestException as e:
         logger.error(f"Namoz vaqtlarini olishda xatolik: {e}")
-        return "⚠️ Namoz vaqtlarini olishda xatolik yuz berdi."
+        return "⚠️ Namoz vaqtlarini olishda xatolik yuz berdi.", False, None
 
 def get_prayer_times_by_coords(lat, lon):
     try:
-        _, _, _, city = get_current_weather_by_coords(lat, lon)
-        if not city:
-            city = "Joylashuvingiz"
+        _, _, _, stats_city = get_current_weather_by_coords(lat, lon)
+        city = stats_city or "Joylashuvingiz"
         current_date = datetime.now().strftime("%d-%m-%Y")
         url = f"http://api.aladhan.com/v1/timings?latitude={lat}&longitude={lon}&method=2"
-        response = requests.get(url, timeout=10).json()
+        response = requests.get(url, timeout=call_timeout()).json()
         if response["code"] != 200:
-            return "❌ Joylashuv bo‘yicha ma’lumot topilmadi."
+            return "❌ Joylashuv bo‘yicha ma’lumot topilmadi.", False, None
         timings = response["data"]["timings"]
         prayer_info = (
             f"🕌 **{city}dagi bugungi namoz vaqtlari ({current_date}):**\n"
@@ -302,22 +850,30 @@ def get_prayer_times_by_coords(lat, lon):
             f"{prayer_emojis['Maghrib']}: {timings['Maghrib']}\n"
             f"{prayer_emojis['Isha']}: {timings['Isha']}"
         )
-        return prayer_info
+        return prayer_info, True, stats_city
+    except DeadlineExceeded:
+        return DEADLINE_MESSAGE, False, None
     except requests.RequestException as e:
         logger.error(f"Namoz vaqtlarini olishda xatolik: {e}")
-        return "⚠️ Namoz vaqtlarini olishda xatolik yuz berdi."
+        return "⚠️ Namoz vaqtlarini olishda xatolik yuz berdi.", False, None
 
 def get_currency_rates():
+    # Vaqt byudjeti tugasa DeadlineExceeded handlerga o‘tkaziladi, u DEADLINE_MESSAGE bilan javob beradi
+    cached = cache_get("currency", "UZS")
+    if cached:
+        return cached
     try:
         cache = get_currency_cache()
         current_time = int(time.time())
         if current_time - cache["timestamp"] < 3600:  # 1 soat kesh
+            cache_set("currency", "UZS", cache["rates"], ttl=3600 - (current_time - cache["timestamp"]))
             return cache["rates"]
         url = "https://api.exchangerate-api.com/v4/latest/UZS"
-        response = requests.get(url, timeout=10)
+        response = requests.get(url, timeout=call_timeout())
         response.raise_for_status()
         rates = response.json()["rates"]
         save_currency_cache(rates)
+        cache_set("currency", "UZS", rates)
         return rates
     except requests.RequestException as e:
         logger.error(f"Valyuta kursini olishda xato: {e}")
@@ -381,6 +937,7 @@ def admin_panel_menu():
     markup = types.ReplyKeyboardMarkup(resize_keyboard=True)
     markup.add(types.KeyboardButton("📢 Barchaga xabar yuborish"), types.KeyboardButton("🚫 Foydalanuvchini bloklash"))
     markup.add(types.KeyboardButton("✅ Blokdan chiqarish"), types.KeyboardButton("👥 Foydalanuvchilar ro‘yxati"))
+    markup.add(types.KeyboardButton("📊 Statistika"), types.KeyboardButton("📥 Shikoyatlar"))
     markup.add(types.KeyboardButton("⬅️ Orqaga"))
     return markup
 
@@ -399,6 +956,8 @@ def send_welcome(message):
                                   "🔽 Quyidagi tugmalardan birini tanlang!", reply_markup=main_menu(user_id))
         else:
             bot.reply_to(message, "🚫 Siz botdan foydalana olmaysiz, chunki bloklangansiz!")
+    except DeadlineExceeded:
+        bot.reply_to(message, DEADLINE_MESSAGE, reply_markup=main_menu(message.from_user.id))
     except Exception as e:
         logger.error(f"Start buyrug‘ida xatolik: {e}")
         bot.reply_to(message, f"⚠️ Xatolik yuz berdi: {str(e)}", reply_markup=main_menu(message.from_user.id))
@@ -437,11 +996,36 @@ def process_admin_panel(message):
                 user_list = "\n".join([f"ID: {user['user_id']}, Username: {user['username']}, Banned: {user['banned']}" for user in users])
                 bot.reply_to(message, f"👥 Foydalanuvchilar ro‘yxati:\n{user_list}", reply_markup=admin_panel_menu())
                 bot.register_next_step_handler(message, process_admin_panel)
+        elif text == "📊 Statistika":
+            bot.reply_to(message, format_usage_stats(get_usage_stats()), reply_markup=admin_panel_menu())
+            bot.register_next_step_handler(message, process_admin_panel)
+        elif text == "📥 Shikoyatlar":
+            bot.reply_to(message, format_feedback_inbox(get_feedback_inbox()), reply_markup=admin_panel_menu())
+            bot.register_next_step_handler(message, process_admin_panel)
+    except DeadlineExceeded:
+        bot.reply_to(message, DEADLINE_MESSAGE, reply_markup=admin_panel_menu())
+        bot.register_next_step_handler(message, process_admin_panel)
     except Exception as e:
         logger.error(f"Admin panelida xatolik: {e}")
         bot.reply_to(message, f"⚠️ Admin panelida xatolik yuz berdi: {str(e)}", reply_markup=admin_panel_menu())
         bot.register_next_step_handler(message, process_admin_panel)
 
+def send_broadcast(admin_chat_id, users, banned_users, text):
+    # Fon oqimida ishlaydi: webhook so‘rovi va uning deadline’i bu yerga tegishli emas
+    sent = 0
+    for user in users:
+        user_id = user["user_id"]
+        if user_id not in banned_users:
+            try:
+                bot.send_message(user_id, f"📢 Admin xabari:\n{text}")
+                sent += 1
+            except Exception as e:
+                logger.error(f"Foydalanuvchi {user_id} ga xabar yuborishda xato: {e}")
+    try:
+        bot.send_message(admin_chat_id, f"✅ Xabar {sent} ta foydalanuvchiga yuborildi!")
+    except Exception as e:
+        logger.error(f"Admin {admin_chat_id} ga hisobot yuborishda xato: {e}")
+
 def broadcast_message(message):
     try:
         if message.text == "⬅️ Orqaga":
@@ -450,14 +1034,13 @@ def broadcast_message(message):
             return
         users = get_users()
         banned_users = get_banned_users()
-        for user in users:
-            user_id = user["user_id"]
-            if user_id not in banned_users:
-                try:
-                    bot.send_message(user_id, f"📢 Admin xabari:\n{message.text}")
-                except Exception as e:
-                    logger.error(f"Foydalanuvchi {user_id} ga xabar yuborishda xato: {e}")
-        bot.reply_to(message, "✅ Xabar barcha foydalanuvchilarga yuborildi!", reply_markup=admin_panel_menu())
+        # Har bir foydalanuvchiga alohida Telegram chaqiruvi ketadi, shuning uchun yuborish
+        # webhook so‘rovini ushlab turmasligi uchun alohida oqimga chiqariladi
+        threading.Thread(target=send_broadcast, args=(message.chat.id, users, banned_users, message.text), name="send_broadcast", daemon=True).start()
+        bot.reply_to(message, "📢 Xabar fon rejimida yuborilmoqda, tugagach hisobot keladi.", reply_markup=admin_panel_menu())
+        bot.register_next_step_handler(message, process_admin_panel)
+    except DeadlineExceeded:
+        bot.reply_to(message, DEADLINE_MESSAGE, reply_markup=admin_panel_menu())
         bot.register_next_step_handler(message, process_admin_panel)
     except Exception as e:
         logger.error(f"Xabar yuborishda xatolik: {e}")
@@ -477,6 +1060,9 @@ def ban_user_handler(message):
     except ValueError:
         bot.reply_to(message, "❌ Iltimos, to‘g‘ri foydalanuvchi ID’sini kiriting (raqam bo‘lishi kerak)!", reply_markup=admin_panel_menu())
         bot.register_next_step_handler(message, process_admin_panel)
+    except DeadlineExceeded:
+        bot.reply_to(message, DEADLINE_MESSAGE, reply_markup=admin_panel_menu())
+        bot.register_next_step_handler(message, process_admin_panel)
     except Exception as e:
         logger.error(f"Bloklashda xatolik: {e}")
         bot.reply_to(message, f"⚠️ Bloklashda xatolik yuz berdi: {str(e)}", reply_markup=admin_panel_menu())
@@ -495,6 +1081,9 @@ def unban_user_handler(message):
     except ValueError:
         bot.reply_to(message, "❌ Iltimos, to‘g‘ri foydalanuvchi ID’sini kiriting (raqam bo‘lishi kerak)!", reply_markup=admin_panel_menu())
         bot.register_next_step_handler(message, process_admin_panel)
+    except DeadlineExceeded:
+        bot.reply_to(message, DEADLINE_MESSAGE, reply_markup=admin_panel_menu())
+        bot.register_next_step_handler(message, process_admin_panel)
     except Exception as e:
         logger.error(f"Blokdan chiqarishda xatolik: {e}")
         bot.reply_to(message, f"⚠️ Blokdan chiqarishda xatolik yuz berdi: {str(e)}", reply_markup=admin_panel_menu())
@@ -519,6 +1108,7 @@ def process_weather_request(message):
             lon = message.location.longitude
             weather_info, lat, lon, city = get_current_weather_by_coords(lat, lon)
             if lat and lon:
+                record_usage("weather", city)
                 forecast_data = get_forecast_weather(lat, lon)
                 if forecast_data:
                     bot.reply_to(message, weather_info, reply_markup=forecast_menu())
@@ -531,6 +1121,7 @@ def process_weather_request(message):
             city = message.text.strip()
             weather_info, lat, lon, city = get_current_weather_by_city(city)
             if lat and lon:
+                record_usage("weather", city)
                 forecast_data = get_forecast_weather(lat, lon)
                 if forecast_data:
                     bot.reply_to(message, weather_info, reply_markup=forecast_menu())
@@ -593,11 +1184,15 @@ def process_prayer_request(message):
         if message.location:
             lat = message.location.latitude
             lon = message.location.longitude
-            prayer_info = get_prayer_times_by_coords(lat, lon)
+            prayer_info, found, city = get_prayer_times_by_coords(lat, lon)
+            if found:
+                record_usage("prayer", city)
             bot.reply_to(message, prayer_info, reply_markup=main_menu(message.from_user.id))
         else:
             city = message.text.strip()
-            prayer_info = get_prayer_times_by_city(city)
+            prayer_info, found, city = get_prayer_times_by_city(city)
+            if found:
+                record_usage("prayer", city)
             bot.reply_to(message, prayer_info, reply_markup=main_menu(message.from_user.id))
     except Exception as e:
         logger.error(f"Namoz vaqtlari so‘rovini qayta ishlashda xatolik: {e}")
@@ -628,6 +1223,7 @@ def process_currency_request(message):
                 if currency != "UZS" and currency in rates:
                     rate = rates[currency]
                     currency_info += f"{emoji}: {1/rate:.2f} UZS\n"
+            record_usage("currency")
             bot.reply_to(message, currency_info, reply_markup=currency_menu())
             bot.register_next_step_handler(message, process_currency_request)
         elif message.text == "💱 Valyuta konvertori":
@@ -642,8 +1238,12 @@ def process_currency_request(message):
                 return
             rate = rates[selected_currency]
             currency_info = f"💱 **{selected_currency} kursi (UZS asosida):**\n1 {selected_currency} = {1/rate:.2f} UZS"
+            record_usage("currency")
             bot.reply_to(message, currency_info, reply_markup=currency_menu())
             bot.register_next_step_handler(message, process_currency_request)
+    except DeadlineExceeded:
+        bot.reply_to(message, DEADLINE_MESSAGE, reply_markup=currency_menu())
+        bot.register_next_step_handler(message, process_currency_request)
     except Exception as e:
         logger.error(f"Valyuta kursi so‘rovini qayta ishlashda xatolik: {e}")
         bot.reply_to(message, f"⚠️ Xatolik yuz berdi: {str(e)}", reply_markup=main_menu(message.from_user.id))
@@ -690,11 +1290,15 @@ def process_currency_conversion_amount(message, from_currency, to_currency):
         to_rate = rates[to_currency]
         amount_in_uzs = amount / from_rate
         converted_amount = amount_in_uzs * to_rate
+        record_usage("currency")
         bot.reply_to(message, f"💱 {amount} {from_currency} = {converted_amount:.2f} {to_currency}", reply_markup=currency_menu())
         bot.register_next_step_handler(message, process_currency_request)
     except ValueError:
         bot.reply_to(message, "❌ Iltimos, to‘g‘ri miqdorni kiriting (raqam bo‘lishi kerak)!", reply_markup=amount_input_menu())
         bot.register_next_step_handler(message, lambda m: process_currency_conversion_amount(m, from_currency, to_currency))
+    except DeadlineExceeded:
+        bot.reply_to(message, DEADLINE_MESSAGE, reply_markup=currency_menu())
+        bot.register_next_step_handler(message, process_currency_request)
     except Exception as e:
         logger.error(f"Valyuta konvertatsiyasida xatolik: {e}")
         bot.reply_to(message, f"⚠️ Xatolik yuz berdi: {str(e)}", reply_markup=main_menu(message.from_user.id))
@@ -719,6 +1323,7 @@ def process_random_number_request(message):
             bot.register_next_step_handler(message, process_random_number_request)
             return
         random_num = generate_random_number(start, end)
+        record_usage("random_number")
         bot.reply_to(message, f"🎲 Tasodifiy son: {random_num}\nYana bir son generatsiya qilish uchun yangi diapazon kiriting yoki orqaga qayting:", reply_markup=random_number_menu())
         bot.register_next_step_handler(message, process_random_number_request)
     except ValueError:
@@ -743,6 +1348,7 @@ def process_wikipedia_request(message):
             bot.reply_to(message, "🏠 Asosiy menyuga qaytdik!", reply_markup=main_menu(message.from_user.id))
             return
         query = message.text.strip()
+        record_usage("wikipedia")
         info = get_wikipedia_info(query)
         bot.reply_to(message, info, reply_markup=main_menu(message.from_user.id))
     except Exception as e:
@@ -766,12 +1372,13 @@ def process_feedback_request(message):
         feedback = message.text.strip()
         user_id = message.from_user.id
         username = message.from_user.username or "Noma'lum"
-        for admin_id in ADMINS:
-            try:
-                bot.send_message(admin_id, f"📝 Yangi shikoyat/taklif:\nFoydalanuvchi: {username} (ID: {user_id})\nXabar: {feedback}")
-            except Exception as e:
-                logger.error(f"Admin {admin_id} ga xabar yuborishda xato: {e}")
-        bot.reply_to(message, "✅ Shikoyat yoki taklifingiz qabul qilindi! Tez orada ko‘rib chiqamiz.", reply_markup=main_menu(message.from_user.id))
+        result = enqueue_feedback(user_id, username, feedback)
+        if result == "rate_limited":
+            bot.reply_to(message, "⏳ Siz juda ko‘p xabar yubordingiz. Iltimos, birozdan so‘ng qayta urinib ko‘ring.", reply_markup=main_menu(message.from_user.id))
+        elif result == "queue_full":
+            bot.reply_to(message, "⚠️ Hozir murojaatlar juda ko‘p. Iltimos, birozdan so‘ng qayta yuboring.", reply_markup=main_menu(message.from_user.id))
+        else:
+            bot.reply_to(message, "✅ Shikoyat yoki taklifingiz qabul qilindi! Tez orada ko‘rib chiqamiz.", reply_markup=main_menu(message.from_user.id))
     except Exception as e:
         logger.error(f"Shikoyat va takliflar so‘rovini qayta ishlashda xatolik: {e}")
         bot.reply_to(message, f"⚠️ Xatolik yuz berdi: {str(e)}", reply_markup=main_menu(message.from_user.id))
@@ -779,14 +1386,32 @@ def process_feedback_request(message):
 # Webhook uchun Flask routelari
 @server.route('/bot', methods=['POST'])
 def webhook():
-    update = telebot.types.Update.de_json(request.stream.read().decode('utf-8'))
-    bot.process_new_updates([update])
+    start_deadline()
+    increment_metric("updates")
+    try:
+        update = telebot.types.Update.de_json(request.stream.read().decode('utf-8'))
+        if mark_update_seen(update.update_id):
+            bot.process_new_updates([update])
+        else:
+            increment_metric("update_redeliveries")
+            logger.info(f"Qayta yuborilgan yangilanish o‘tkazib yuborildi: {update.update_id}")
+    except Exception as e:
+        logger.error(f"Yangilanishni qayta ishlashda xatolik: {e}")
+    finally:
+        finish_deadline()
     return 'OK', 200
 
 @server.route('/')
 def index():
     return 'Bot is running!'
 
+@server.route('/metrics')
+def metrics_view():
+    with metrics_lock:
+        stats = dict(metrics)
+    stats["redelivery_rate"] = stats["update_redeliveries"] / stats["updates"] if stats["updates"] else 0
+    return stats
+
 # Webhook sozlash va serverni ishga tushirish
 if __name__ == "__main__":
     # Webhook sozlash
@@ -0,0 +1,201 @@
+import os
+import re
+import bz2
+import sys
+import sqlite3
+import logging
+import threading
+import xml.etree.ElementTree as ET
+
+logger = logging.getLogger(__name__)
+
+WIKI_INDEX_PATH = os.environ.get('WIKI_INDEX_PATH', 'uzwiki_index.db')
+
+# O‘zbek apostroflari (ʻ ʼ) harf sifatida emas, ajratuvchi sifatida olinadi,
+# shunda "Oʻzbekiston", "O‘zbekiston" va "O'zbekiston" bir xil tokenlarga bo‘linadi
+INDEX_SCHEMA = (
+    "CREATE VIRTUAL TABLE articles USING fts5("
+    "title, lead, tokenize = \"unicode61 remove_diacritics 2 separators 'ʻʼ'\")"
+)
+
+SKIPPED_LINK_PREFIXES = ("fayl:", "file:", "rasm:", "image:", "tasvir:", "kategoriya:", "category:")
+
+# Ko‘p ma’noli sahifalar ({{Disambig}}, {{Maʼnolari}}, {{Koʻp maʼnoli}} va h.k.) indeksga kiritilmaydi:
+# ularning kirish qismi faqat "X quyidagi maʼnolarga ega:" kabi bo‘sh jumla bo‘lib qoladi
+DISAMBIGUATION_TEMPLATE = re.compile(
+    r"\{\{\s*(disambig\w*|dab|ma[ʼ'’‘`]?no\w*|ko[ʻ'’‘`]?p\s*ma[ʼ'’‘`]?no\w*|bir\s+nechta\s+ma[ʼ'’‘`]?no\w*)\s*[|}]",
+    re.IGNORECASE,
+)
+
+_index_conn = None
+_index_lock = threading.Lock()
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+def _strip_nested(text, opening, closing):
+    # Ichma-ich {{...}} shablonlari va {|...|} jadvallarini olib tashlash
+    out = []
+    depth = 0
+    i = 0
+    while i < len(text):
+        if text.startswith(opening, i):
+            depth += 1
+            i += len(opening)
+        elif depth and text.startswith(closing, i):
+            depth -= 1
+            i += len(closing)
+        else:
+            if depth == 0:
+                out.append(text[i])
+            i += 1
+    return "".join(out)
+
+def _replace_link(match):
+    target, _, label = match.group(1).partition("|")
+    if target.strip().lower().startswith(SKIPPED_LINK_PREFIXES):
+        return ""
+    return label or target
+
+def extract_lead(wikitext, max_length=1500):
+    # Maqolaning birinchi sarlavhagacha bo‘lgan kirish qismini oddiy matnga aylantirish
+    lead = re.split(r"\n==", wikitext, maxsplit=1)[0]
+    lead = re.sub(r"<!--.*?-->", "", lead, flags=re.S)
+    lead = re.sub(r"<ref[^>]*/>", "", lead)
+    lead = re.sub(r"<ref[^>]*>.*?</ref>", "", lead, flags=re.S)
+    lead = _strip_nested(lead, "{{", "}}")
+    lead = _strip_nested(lead, "{|", "|}")
+    # Ichki havolalar bo‘lgan fayl havolalarini ichkaridan tashqariga qarab ochish
+    while True:
+        lead, replaced = re.subn(r"\[\[([^\[\]]*)\]\]", _replace_link, lead)
+        if not replaced:
+            break
+    lead = re.sub(r"\[https?://\S+\s*([^\]]*)\]", r"\1", lead)
+    lead = re.sub(r"<[^>]+>", "", lead)
+    lead = re.sub(r"'{2,}", "", lead)
+    paragraphs = []
+    for line in lead.splitlines():
+        line = line.strip()
+        if line and not line.startswith(("|", "!", "*", "#", ":", ";", "__")):
+            paragraphs.append(line)
+    return re.sub(r"\s+", " ", " ".join(paragraphs)).strip()[:max_length]
+
+def is_disambiguation(title, wikitext):
+    if DISAMBIGUATION_TEMPLATE.search(wikitext):
+        return True
+    return bool(re.search(r"\(ma[ʼ'’‘`]?nolari\)$", title, re.IGNORECASE))
+
+def summarize(text, sentences=3):
+    parts = re.split(r"(?<=[.!?])\s+", text)
+    return " ".join(parts[:sentences])
+
+def build_wikipedia_index(dump_path, index_path=WIKI_INDEX_PATH, batch_size=1000):
+    # uzwiki-*-pages-articles.xml(.bz2) dampidan sarlavha va kirish qismlarining FTS5 indeksini yaratish
+    tmp_path = index_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    conn.execute(INDEX_SCHEMA)
+    opener = bz2.open if dump_path.endswith(".bz2") else open
+    count = 0
+    batch = []
+    with opener(dump_path, "rb") as dump:
+        for _, elem in ET.iterparse(dump, events=("end",)):
+            if _local_name(elem.tag) != "page":
+                continue
+            title, ns, text, redirect = None, None, "", False
+            for child in elem.iter():
+                name = _local_name(child.tag)
+                if name == "title":
+                    title = child.text
+                elif name == "ns":
+                    ns = child.text
+                elif name == "redirect":
+                    redirect = True
+                elif name == "text":
+                    text = child.text or ""
+            elem.clear()
+            if ns != "0" or redirect or not title or is_disambiguation(title, text):
+                continue
+            lead = extract_lead(text)
+            # Ro‘yxatlar olib tashlangach ":" bilan tugaydigan qisqa kirish ham ko‘p ma’noli sahifa belgisi
+            if not lead or (lead.endswith(":") and len(lead) < 200):
+                continue
+            batch.append((title, lead))
+            if len(batch) >= batch_size:
+                conn.executemany("INSERT INTO articles (title, lead) VALUES (?, ?)", batch)
+                count += len(batch)
+                batch = []
+    if batch:
+        conn.executemany("INSERT INTO articles (title, lead) VALUES (?, ?)", batch)
+        count += len(batch)
+    conn.execute("INSERT INTO articles (articles) VALUES ('optimize')")
+    conn.commit()
+    conn.close()
+    os.replace(tmp_path, index_path)
+    return count
+
+def _get_index_connection():
+    global _index_conn
+    if _index_conn is None and os.path.exists(WIKI_INDEX_PATH):
+        _index_conn = sqlite3.connect(f"file:{WIKI_INDEX_PATH}?mode=ro", uri=True, check_same_thread=False)
+    return _index_conn
+
+MIN_PREFIX_LENGTH = 3
+
+def _normalize_title(title):
+    return re.sub(r"[‘’ʻʼ`']", "'", title).casefold().strip()
+
+def _tokenize(text):
+    return re.findall(r"\w+", re.sub(r"[‘’ʻʼ`']", " ", text).casefold())
+
+def _token_matches(query_token, title_token):
+    if len(query_token) < MIN_PREFIX_LENGTH:
+        return query_token == title_token
+    return title_token.startswith(query_token)
+
+def _title_matches(tokens, title):
+    # So‘rovdagi har bir so‘z sarlavhadagi biror so‘zga (qisqa so‘zlar to‘liq, qolganlari prefiks bo‘yicha) mos kelishi kerak
+    title_tokens = _tokenize(title)
+    return all(any(_token_matches(token, title_token) for title_token in title_tokens) for token in tokens)
+
+def search_wikipedia_index(query, limit=5):
+    # Mahalliy indeksdan eng mos maqolalarni qaytaradi; indeks bo‘lmasa yoki sarlavhasi
+    # so‘rovga mos maqola topilmasa None (bu holda tarmoqdan qidiriladi)
+    tokens = _tokenize(query)
+    if not tokens:
+        return None
+    # O‘zbek so‘zlari qo‘shimchalar oladi ("Osiyo" -> "Osiyodagi"), shuning uchun prefiks bo‘yicha
+    # qidiriladi; juda qisqa so‘zlar esa faqat to‘liq mos kelganda hisobga olinadi
+    match_expr = " ".join(f'"{token}"*' if len(token) >= MIN_PREFIX_LENGTH else f'"{token}"' for token in tokens)
+    with _index_lock:
+        conn = _get_index_connection()
+        if conn is None:
+            return None
+        try:
+            rows = conn.execute(
+                "SELECT title, lead FROM articles WHERE articles MATCH ? "
+                "ORDER BY bm25(articles, 10.0, 1.0) LIMIT ?",
+                (match_expr, limit),
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.error(f"Vikipediya indeksidan qidirishda xatolik: {e}")
+            return None
+    hits = [row for row in rows if _title_matches(tokens, row[0])]
+    if not hits:
+        return None
+    wanted = _normalize_title(query)
+    # Sarlavhasi so‘rovga to‘liq mos keladigan maqola birinchi o‘ringa, faqat matnda
+    # uchragan maqolalar esa o‘xshash maqolalar sifatida oxiriga qo‘yiladi
+    hits.sort(key=lambda row: _normalize_title(row[0]) != wanted)
+    related = [row for row in rows if row not in hits]
+    return [(title, summarize(lead)) for title, lead in hits + related]
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if len(sys.argv) < 2:
+        print("Foydalanish: python wiki_index.py uzwiki-latest-pages-articles.xml.bz2 [indeks.db]")
+        sys.exit(1)
+    index_path = sys.argv[2] if len(sys.argv) > 2 else WIKI_INDEX_PATH
+    total = build_wikipedia_index(sys.argv[1], index_path)
+    logger.info(f"Vikipediya indeksi yaratildi: {index_path} ({total} ta maqola)")